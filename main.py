@@ -1,115 +1,253 @@
+import io
+
 import pandas as pd
 import streamlit as st
 import numpy as np
-import matplotlib.pyplot as plt
+from matplotlib.figure import Figure
 import pydeck as pdk
+import numexpr as ne
 
-# Load dataset
-file_name = "skyscrapers.csv"
-df = pd.read_csv(file_name)
+import prepare_data
 
-# Data cleaning and preparation
-df['location.city'] = df['location.city'].fillna('Unknown')
-df.columns = df.columns.str.replace('.', '_')
-df['status_completed_year'] = df['status_completed_year'].replace(0, np.nan)
+# Load the cleaned dataset once; Streamlit reuses the result across reruns.
+# The Parquet copy written by prepare_data.py is used when it matches the current CSV
+# and cleaning code; otherwise the CSV is parsed and cleaned directly.
+@st.cache_data
+def load_data(path: str) -> pd.DataFrame:
+    df = prepare_data.read_parquet(path)
+    if df is None:
+        df = prepare_data.read_csv(path)
+    return df
 
-# Streamlit UI Customization
-st.markdown(
-    """
-    <style>
-    body {
-        background-color: #191919;
-        color: #a18972;
-        font-family: 'Arial', sans-serif;
-    }
 
-    [data-testid="stSidebar"] {
-        background-color: #191919;
-        color: #a18972;
+# Static sidebar widget bounds and options derived from the full dataset
+@st.cache_data
+def widget_options(path: str) -> dict:
+    df = load_data(path)
+    return {
+        'years': (int(df['status_completed_year'].min()), int(df['status_completed_year'].max())),
+        'heights': (int(df['statistics_height'].min()), int(df['statistics_height'].max())),
+        'cities': tuple(df['location_city'].unique()),
     }
 
-    h1, h2, h3, h4, h5, h6 {
-        color: #a18972;
-    }
 
-    input, textarea {
-        color: #a18972;
-        background-color: #292929;
-    }
+# Plain NumPy views of the columns the sidebar filters compare against
+@st.cache_data
+def filter_arrays(path: str) -> tuple:
+    df = load_data(path)
+    # Missing years become 0, which lies outside every selectable year range
+    return (
+        df['status_completed_year'].to_numpy(dtype=np.int16, na_value=0),
+        df['statistics_height'].to_numpy(),
+        df['location_city'].cat.codes.to_numpy(),
+        # Heights rounded to whole meters for the 3D map's column elevation
+        np.rint(df['statistics_height'].to_numpy()).astype(np.int16),
+    )
 
-    button {
-        background-color: #a18972 !important;
-        color: #191919 !important;
-    }
 
-    table {
-        color: #a18972;
-        background-color: #292929;
-        font-size: 14px;
-    }
-    </style>
-    """,
-    unsafe_allow_html=True
-)
+# Per-city centroids used to center the 3D map
+@st.cache_data
+def city_aggs(path: str) -> pd.DataFrame:
+    df = load_data(path)
+    # Towers without a known location are stored at (0, 0); keep them out of the centroid
+    located = (df['location_latitude'] != 0) | (df['location_longitude'] != 0)
+    return df[located].groupby('location_city', observed=False).agg(
+        lat=('location_latitude', 'mean'),
+        lon=('location_longitude', 'mean'),
+    ).fillna(0)
+
+
+# Page styling; it must be emitted on every run because Streamlit removes
+# elements a rerun does not render again
+CSS = """
+<style>
+body {
+    background-color: #191919;
+    color: #a18972;
+    font-family: 'Arial', sans-serif;
+}
+
+[data-testid="stSidebar"] {
+    background-color: #191919;
+    color: #a18972;
+}
+
+h1, h2, h3, h4, h5, h6 {
+    color: #a18972;
+}
+
+input, textarea {
+    color: #a18972;
+    background-color: #292929;
+}
+
+button {
+    background-color: #a18972 !important;
+    color: #191919 !important;
+}
+
+table {
+    color: #a18972;
+    background-color: #292929;
+    font-size: 14px;
+}
+</style>
+"""
+
+
+file_name = "skyscrapers.csv"
+df = load_data(file_name)
+options = widget_options(file_name)
+year_arr, height_arr, city_codes, height_int_arr = filter_arrays(file_name)
+aggs = city_aggs(file_name)
+city_categories = df['location_city'].cat.categories.to_numpy()
+
+
+# Boolean row mask for the sidebar filters. A plain bool array is kept rather than
+# bit-packed words: at a few thousand rows the mask is a few KB, and np.packbits /
+# np.unpackbits would add two extra passes to save nothing measurable.
+def build_mask(year_range, height_range, city_filter):
+    # numexpr fuses the four comparisons into one pass without temporary arrays
+    mask = ne.evaluate(
+        "(year >= y0) & (year <= y1) & (height >= h0) & (height <= h1)",
+        local_dict={
+            'year': year_arr, 'y0': year_range[0], 'y1': year_range[1],
+            'height': height_arr, 'h0': height_range[0], 'h1': height_range[1],
+        },
+    )
+    if city_filter:
+        # Per-category lookup table: one gather per row instead of np.isin's sort and search
+        allowed = np.zeros(len(city_categories), dtype=bool)
+        selected_codes = df['location_city'].cat.categories.get_indexer(city_filter)
+        # get_indexer returns -1 for unknown names, which would select the last category
+        allowed[selected_codes[selected_codes >= 0]] = True
+        mask &= allowed[city_codes]
+    return mask
+
+
+# Ten cities with the most skyscrapers under the given filters
+@st.cache_data(max_entries=32)
+def top_cities(year_range, height_range, city_filter):
+    codes = city_codes[build_mask(year_range, height_range, city_filter)]
+    counts = np.bincount(codes, minlength=len(city_categories))
+    # Break ties by first appearance in the filtered rows, as value_counts does
+    first_seen = np.full(len(city_categories), codes.size)
+    present, first_index = np.unique(codes, return_index=True)
+    first_seen[present] = first_index
+    top = np.lexsort((first_seen, -counts))[:10]
+    top = top[counts[top] > 0]
+    return city_categories[top], counts[top]
+
+
+# Skyscrapers completed per year, from the earliest matching year through 2024
+@st.cache_data(max_entries=32)
+def year_trend(year_range, height_range, city_filter):
+    years = year_arr[build_mask(year_range, height_range, city_filter)].astype(np.int32)
+    if years.size == 0:
+        return np.array([], dtype=np.int32), np.array([], dtype=np.int64)
+    year_min = years.min()
+    counts = np.bincount(years - year_min, minlength=2025 - year_min)
+    return np.arange(year_min, year_min + counts.size), counts
+
+
+# One city's towers for the 3D map, merged into ~100 m grid cells (lat/lon rounded to
+# 3 decimals) so dense downtowns send one column per cell, as tall as its tallest tower
+@st.cache_data(max_entries=32)
+def city_map_data(city, year_range, height_range, city_filter):
+    mask = build_mask(year_range, height_range, city_filter)
+    mask &= city_codes == df['location_city'].cat.categories.get_loc(city)
+    cells = pd.DataFrame({
+        'lon': df.loc[mask, 'location_longitude'].to_numpy(dtype=np.float64).round(3),
+        'lat': df.loc[mask, 'location_latitude'].to_numpy(dtype=np.float64).round(3),
+        'statistics_height': height_int_arr[mask],
+    })
+    cells = cells.groupby(['lon', 'lat'], as_index=False).agg(statistics_height=('statistics_height', 'max'))
+    return pd.DataFrame({
+        'location_city': city,
+        'statistics_height': cells['statistics_height'],
+        'position': cells[['lon', 'lat']].to_numpy().tolist(),
+    })
+
+
+# Filtered rows encoded as CSV bytes once per filter combination. Values are written from
+# the downcast frame: heights and coordinates keep float32 precision (1609.36 rather than
+# 1609.3599853516) and completion years are whole numbers (2010 rather than 2010.0)
+@st.cache_data(max_entries=32)
+def filtered_csv(year_range, height_range, city_filter):
+    rows = df.loc[build_mask(year_range, height_range, city_filter)]
+    return rows.to_csv(index=False).encode('utf-8')
+
+
+# Charts are rendered to PNG bytes once per distinct input and reused across reruns.
+# Each figure is built with the object-oriented API and discarded after rendering,
+# since matplotlib objects are not safe to share between sessions' threads.
+def _figure_png(fig):
+    buf = io.BytesIO()
+    fig.savefig(buf, format='png', bbox_inches='tight', dpi=200)
+    return buf.getvalue()
+
+
+def _style_axes(fig, ax, xlabel):
+    fig.patch.set_facecolor("#191919")
+    ax.set_facecolor("#191919")
+    ax.set_xlabel(xlabel, fontsize=14, color="#a18972")
+    ax.set_ylabel("Number of Skyscrapers", fontsize=14, color="#a18972")
+    ax.tick_params(axis='x', labelrotation=45, labelsize=12, labelcolor="#a18972")
+    ax.tick_params(axis='y', labelsize=12, labelcolor="#a18972")
+    for label in ax.get_xticklabels():
+        label.set_horizontalalignment('right')
+    ax.grid(axis='y', linestyle='--', linewidth=0.7, alpha=0.5, color="#a18972")
+
+
+@st.cache_data(max_entries=32)
+def bar_png(labels, values):
+    fig = Figure(figsize=(10, 6))
+    ax = fig.subplots()
+    ax.bar(labels, values, color='#a18972')
+    _style_axes(fig, ax, "City")
+    return _figure_png(fig)
+
+
+@st.cache_data(max_entries=32)
+def trend_png(years, counts):
+    fig = Figure(figsize=(10, 6))
+    ax = fig.subplots()
+    ax.plot(years, counts, color='#a18972', linewidth=2)
+    _style_axes(fig, ax, "Year")
+    return _figure_png(fig)
+
+
+# Streamlit UI Customization
+st.markdown(CSS, unsafe_allow_html=True)
 
 # Sidebar Filters
 st.sidebar.header('Filter Options')
 year_range = st.sidebar.slider(
     'Year Built Range',
-    int(df['status_completed_year'].min()),
-    int(df['status_completed_year'].max()),
+    *options['years'],
     (1850, 2020)
 )
 height_range = st.sidebar.slider(
     'Height Range (m)',
-    int(df['statistics_height'].min()),
-    int(df['statistics_height'].max()),
+    *options['heights'],
     (0, 1609)
 )
 city_filter = st.sidebar.multiselect(
     'Select Cities (or deselect all for all cities)',
-    options=df['location_city'].unique(),
+    options=options['cities'],
     default=None
 )
 
 # Apply Filters
-filtered_df = df[
-    (df['status_completed_year'] >= year_range[0]) &
-    (df['status_completed_year'] <= year_range[1]) &
-    (df['statistics_height'] >= height_range[0]) &
-    (df['statistics_height'] <= height_range[1])
-]
-if city_filter:
-    filtered_df = filtered_df[filtered_df['location_city'].isin(city_filter)]
-
-# Drop unwanted columns
-columns_to_exclude = ['id', 'location_city_id', 'location_country id', 'purposes_abandoned',
-                      'purposes_air traffic control tower', 'purposes_belltower', 'purposes_bridge',
-                      'purposes_casino', 'purposes_commercial', 'purposes_education', 'purposes_exhibition',
-                      'purposes_government', 'purposes_hospital', 'purposes_hotel', 'purposes_industrial',
-                      'purposes_library', 'purposes_multiple', 'purposes_museum', 'purposes_observation',
-                      'purposes_office', 'purposes_other', 'purposes_religious', 'purposes_residential',
-                      'purposes_retail', 'purposes_serviced apartments', 'purposes_telecommunications',
-                      'status_completed_is completed', 'status_started_is started']
-filtered_df = filtered_df.drop(columns=columns_to_exclude, axis=1)
-
-# Tabs for better organization
-tab1, tab2, tab3, tab4, tab5, tab6 = st.tabs([
-    "Filtered Data", "3D Map", "Statistics", "Top Cities", "Trend Over Time", "Download Data"
-])
-
-# Tab 1: Filtered Data
-with tab1:
-    st.subheader("Filtered Data")
-    st.write(filtered_df)
+mask = build_mask(year_range, height_range, city_filter)
+filtered_df = df.loc[mask]
 
-# Tab 2: 3D Map that demonstrates heights of skyscrapers
-with tab2:
+# Interactive tab bodies run as fragments: using a widget inside one reruns only that
+# fragment, while the sidebar filters still rerun the whole script
+@st.fragment
+def render_map_tab(filtered_df, year_range, height_range, city_filter):
     st.subheader("3D Map of Skyscraper Heights")
 
-    # Round the height to the nearest meter
-    filtered_df['statistics_height'] = round(filtered_df['statistics_height'], 0)
-
     # Ensure latitude and longitude columns exist
     if not filtered_df.empty and 'location_latitude' in filtered_df.columns and 'location_longitude' in filtered_df.columns:
         # Dropdown to select a city
@@ -117,12 +255,12 @@ with tab2:
         selected_city = st.selectbox("Select a City", options=unique_cities, index=0)
 
         # Filter data for the selected city
-        city_data = filtered_df[filtered_df['location_city'] == selected_city]
+        city_data = city_map_data(selected_city, year_range, height_range, tuple(city_filter))
 
         # Set map view to the selected city
         view_state = pdk.ViewState(
-            latitude=city_data['location_latitude'].mean(),
-            longitude=city_data['location_longitude'].mean(),
+            latitude=float(aggs.at[selected_city, 'lat']),
+            longitude=float(aggs.at[selected_city, 'lon']),
             zoom=12,  # Zoom level for the selected city
             pitch=50  # 3D pitch angle
         )
@@ -131,7 +269,7 @@ with tab2:
         layer = pdk.Layer(
             "ColumnLayer",
             data=city_data,
-            get_position=["location_longitude", "location_latitude"],
+            get_position="position",
             get_elevation="statistics_height",  # Skyscraper height
             elevation_scale=5,
             radius=100,
@@ -151,21 +289,58 @@ with tab2:
     else:
         st.write("No data available or missing latitude/longitude columns for visualization.")
 
+
+@st.fragment
+def render_download_tab(filtered_df, year_range, height_range, city_filter):
+    st.subheader("Download Filtered Data")
+    if not filtered_df.empty:
+        st.download_button(
+            label="Download CSV",
+            data=filtered_csv(year_range, height_range, tuple(city_filter)),
+            file_name="filtered_skyscrapers.csv",
+            mime="text/csv"
+        )
+    else:
+        st.write("No data available for download.")
+
+
+# Tabs for better organization
+tab1, tab2, tab3, tab4, tab5, tab6 = st.tabs([
+    "Filtered Data", "3D Map", "Statistics", "Top Cities", "Trend Over Time", "Download Data"
+])
+
+# Tab 1: Filtered Data
+with tab1:
+    st.subheader("Filtered Data")
+    st.write(filtered_df)
+
+# Tab 2: 3D Map that demonstrates heights of skyscrapers
+with tab2:
+    render_map_tab(filtered_df, year_range, height_range, city_filter)
+
 # Tab 3: Statistics
 with tab3:
     st.subheader("Skyscraper Statistics")
 
     # Filter out rows where height is 0
-    filtered_df_nonzero = filtered_df[filtered_df['statistics_height'] > 0]
-
-    # Perform calculations on the filtered data
-    summary = {
-        "Tallest Skyscraper Height (m)": filtered_df_nonzero['statistics_height'].max(),
-        "Shortest Skyscraper Height (m)": filtered_df_nonzero['statistics_height'].min(),
-        "Average Skyscraper Height (m)": round(filtered_df_nonzero['statistics_height'].mean(),2),
-        "Median Skyscraper Height (m)": filtered_df_nonzero['statistics_height'].median(),
-        "Number of Skyscrapers": filtered_df_nonzero.shape[0],
-    }
+    heights = height_arr[mask]
+    heights = heights[heights > 0]
+
+    # Perform calculations on the filtered data with NumPy reductions over one array
+    if heights.size:
+        summary = {
+            "Tallest Skyscraper Height (m)": round(float(heights.max()),2),
+            "Shortest Skyscraper Height (m)": round(float(heights.min()),2),
+            "Average Skyscraper Height (m)": round(float(heights.mean(dtype=np.float64)),2),
+            "Median Skyscraper Height (m)": round(float(np.median(heights)),2),
+            "Number of Skyscrapers": heights.size,
+        }
+    else:
+        summary = dict.fromkeys([
+            "Tallest Skyscraper Height (m)", "Shortest Skyscraper Height (m)",
+            "Average Skyscraper Height (m)", "Median Skyscraper Height (m)",
+        ], np.nan)
+        summary["Number of Skyscrapers"] = 0
 
     # Display the summary as a table
     st.write(pd.DataFrame.from_dict(summary, orient='index', columns=["Value"]))
@@ -173,45 +348,15 @@ with tab3:
 # Tab 4: Top Cities Visualization
 with tab4:
     st.subheader("Top Cities with the Most Skyscrapers")
-    city_counts = filtered_df['location_city'].value_counts().head(10)
-    fig, ax = plt.subplots(figsize=(10, 6))
-    bars = ax.bar(city_counts.index, city_counts.values, color='#a18972')
-    fig.patch.set_facecolor("#191919")
-    ax.set_facecolor("#191919")
-    ax.set_xlabel("City", fontsize=14, color="#a18972")
-    ax.set_ylabel("Number of Skyscrapers", fontsize=14, color="#a18972")
-    plt.xticks(rotation=45, ha="right", fontsize=12, color="#a18972")
-    plt.yticks(fontsize=12, color="#a18972")
-    ax.grid(axis='y', linestyle='--', linewidth=0.7, alpha=0.5, color="#a18972")
-    st.pyplot(fig)
+    top_labels, top_counts = top_cities(year_range, height_range, tuple(city_filter))
+    st.image(bar_png(tuple(top_labels.tolist()), tuple(top_counts.tolist())))
 
 # Tab 5: Trend Over Time Visualization
 with tab5:
     st.subheader("Trend of Skyscraper Construction Over Time")
-    year_counts = filtered_df['status_completed_year'].dropna().value_counts().sort_index()
-    all_years = pd.Series(0, index=pd.RangeIndex(start=int(year_counts.index.min()), stop=2025))
-    year_counts = all_years.add(year_counts, fill_value=0).sort_index()
-    fig, ax = plt.subplots(figsize=(10, 6))
-    ax.plot(year_counts.index, year_counts.values, color='#a18972', linewidth=2)
-    fig.patch.set_facecolor("#191919")
-    ax.set_facecolor("#191919")
-    ax.set_xlabel("Year", fontsize=14, color="#a18972")
-    ax.set_ylabel("Number of Skyscrapers", fontsize=14, color="#a18972")
-    plt.xticks(rotation=45, ha="right", fontsize=12, color="#a18972")
-    plt.yticks(fontsize=12, color="#a18972")
-    ax.grid(axis='y', linestyle='--', linewidth=0.7, alpha=0.5, color="#a18972")
-    st.pyplot(fig)
+    trend_years, trend_counts = year_trend(year_range, height_range, tuple(city_filter))
+    st.image(trend_png(tuple(trend_years.tolist()), tuple(trend_counts.tolist())))
 
 # Tab 6: Download Data
 with tab6:
-    st.subheader("Download Filtered Data")
-    if not filtered_df.empty:
-        csv = filtered_df.to_csv(index=False)
-        st.download_button(
-            label="Download CSV",
-            data=csv,
-            file_name="filtered_skyscrapers.csv",
-            mime="text/csv"
-        )
-    else:
-        st.write("No data available for download.")
+    render_download_tab(filtered_df, year_range, height_range, city_filter)